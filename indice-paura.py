@@ -1,9 +1,11 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import numpy as np
+from numba import njit
 from datetime import datetime, timedelta
+from pathlib import Path
+import os
+import tempfile
 
 # Configurazione pagina
 st.set_page_config(
@@ -35,71 +37,398 @@ end_date = st.sidebar.date_input(
     max_value=today
 )
 
-# Checkbox per mostrare/nascondere componenti
-show_ma = st.sidebar.checkbox("Mostra media mobile (20 giorni)", value=True)
-show_bb = st.sidebar.checkbox("Mostra Bande di Bollinger", value=True)
-show_vix = st.sidebar.checkbox("Mostra VIX", value=True)
-show_sp500 = st.sidebar.checkbox("Mostra S&P500", value=True)
+# Media mobile e Bande di Bollinger in un'unica passata sui dati
+@njit(cache=True, fastmath=True)
+def bollinger(ratio, w, k):
+    n = ratio.shape[0]
+    ma = np.full(n, np.nan)
+    up = np.full(n, np.nan)
+    lo = np.full(n, np.nan)
+    s = 0.0
+    s2 = 0.0
+    for i in range(n):
+        s += ratio[i]
+        s2 += ratio[i] * ratio[i]
+        if i >= w:
+            s -= ratio[i - w]
+            s2 -= ratio[i - w] * ratio[i - w]
+        if i >= w - 1:
+            mean = s / w
+            # Varianza campionaria (ddof=1), come rolling().std() di pandas
+            var = (s2 - s * mean) / (w - 1)
+            std = np.sqrt(max(var, 0.0))
+            ma[i] = mean
+            up[i] = mean + k * std
+            lo[i] = mean - k * std
+    return ma, up, lo
 
-# Download dei dati
+# Compila il kernel una sola volta per processo Streamlit e restituisce il
+# dispatcher già compilato: a ogni rerun lo script ridefinisce `bollinger`,
+# quindi va usato sempre quello restituito da qui
+@st.cache_resource
+def get_bollinger():
+    bollinger(np.zeros(32), 20, 2.0)
+    return bollinger
+
+# Warm-up all'avvio: al primo caricamento compila il kernel prima che servano i
+# dati, nei rerun successivi è solo un accesso alla cache
+get_bollinger()
+
+# Cache su disco dei prezzi di chiusura (sopravvive ai riavvii del server)
+CACHE_DIR = Path(__file__).parent / ".cache"
+CACHE_TTL = timedelta(hours=6)  # Età massima prima di aggiornare l'ultima parte
+CACHE_STABLE_DAYS = 5  # Giorni lavorativi oltre i quali i dati sono definitivi
+CACHE_HEAD_SLACK = timedelta(days=5)  # Giorni di chiusura consecutivi tollerati a inizio serie
+
+# Scarica i prezzi di chiusura dei ticker in un'unica richiesta; restituisce None
+# se il download fallisce o manca anche un solo ticker, così un risultato
+# incompleto non finisce mai nella cache
+def fetch_closes(tickers, start, end=None):
+    import yfinance as yf  # Import ritardato: pesante e necessario solo qui
+    
+    try:
+        raw = yf.download(
+            tickers,
+            start=start,
+            end=end,
+            group_by='ticker',
+            auto_adjust=True,
+            progress=False,
+            threads=True
+        )
+        closes = pd.DataFrame({ticker: raw[ticker]['Close'] for ticker in tickers})
+    except Exception:
+        return None
+    
+    if closes.empty or closes.isna().all().any():
+        return None
+    # Scarta le righe con un ticker mancante (es. barra del giorno non ancora pubblicata)
+    closes = closes.dropna()
+    return closes if not closes.empty else None
+
+# Legge la cache su disco; un file illeggibile equivale a nessuna cache
+def read_cache(cache_file):
+    try:
+        cached = pd.read_parquet(cache_file).dropna()
+        mtime = datetime.fromtimestamp(cache_file.stat().st_mtime)
+    except Exception:
+        return None, None
+    if cached.empty:
+        return None, None
+    return cached, mtime
+
+# Scrive la cache su un file temporaneo e lo sostituisce in modo atomico,
+# così le altre sessioni non leggono mai un file scritto a metà
+def write_cache(cache_file, closes, mtime=None):
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        os.close(fd)
+        try:
+            closes.to_parquet(tmp_name)
+            if mtime is not None:
+                # Conserva la data di aggiornamento della parte recente
+                os.utime(tmp_name, (mtime.timestamp(), mtime.timestamp()))
+            os.replace(tmp_name, cache_file)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+    except Exception:
+        pass  # La cache su disco è solo un'ottimizzazione
+
+# Prezzi di chiusura dei ticker, riusando la cache su disco (un file per insieme
+# di ticker, indipendente dalle date richieste)
+def download_closes(tickers, start_date, end_date):
+    cache_name = "_".join(ticker.lstrip('^') for ticker in tickers)
+    cache_file = CACHE_DIR / f"{cache_name}.parquet"
+    start_ts = pd.Timestamp(start_date)
+    end_ts = pd.Timestamp(end_date)
+    cached, mtime = read_cache(cache_file)
+    
+    if cached is None:
+        # Scarica sempre fino ad oggi, così il file copre qualsiasi data di fine
+        closes = fetch_closes(tickers, start_date)
+        if closes is None:
+            return pd.DataFrame(columns=tickers)
+    else:
+        closes = cached
+        changed = False
+        
+        # Scarica la parte iniziale mancante se l'intervallo parte prima della cache
+        if start_ts < closes.index[0] - CACHE_HEAD_SLACK:
+            head = fetch_closes(tickers, start_date, closes.index[0].date())
+            if head is not None:
+                closes = pd.concat([head, closes])
+                changed = True
+        
+        # Barre già definitive quando il file è stato scritto: non serve riscaricarle.
+        # Le più recenti (inclusa quella parziale della giornata del download) vanno
+        # aggiornate dopo il TTL o al cambio di giorno; se il download fallisce si
+        # continua a usare la cache, senza toccarne la data di aggiornamento
+        stable_until = pd.Timestamp(mtime.date()) - pd.offsets.BDay(CACHE_STABLE_DAYS)
+        expired = datetime.now() - mtime >= CACHE_TTL or mtime.date() < datetime.now().date()
+        if expired and end_ts > stable_until:
+            stable = closes[closes.index < stable_until]
+            tail_start = (stable.index[-1] + timedelta(days=1)).date() if not stable.empty else start_date
+            tail = fetch_closes(tickers, tail_start)
+            if tail is not None:
+                closes = pd.concat([stable, tail])
+                mtime = None
+                changed = True
+        
+        if not changed:
+            return closes[(closes.index >= start_ts) & (closes.index < end_ts)]
+    
+    closes = closes[~closes.index.duplicated(keep='last')].sort_index()
+    write_cache(cache_file, closes, mtime)
+    
+    return closes[(closes.index >= start_ts) & (closes.index < end_ts)]
+
+# Download dei dati; in cache solo array NumPy e indice, più leggeri da
+# serializzare di un DataFrame
 @st.cache_data(ttl=3600)  # Cache per 1 ora
-def get_data(start_date, end_date):
+def load_series(start_date, end_date):
     try:
         # Download dati VIX e S&P500
-        vix_data = yf.download("^VIX", start=start_date, end=end_date)
-        sp500_data = yf.download("^GSPC", start=start_date, end=end_date)
+        closes = download_closes(["^VIX", "^GSPC"], start_date, end_date)
         
         # Verifica che i dati siano stati scaricati correttamente
-        if vix_data.empty or sp500_data.empty:
+        if closes.empty:
             st.error("Impossibile scaricare i dati. Controlla la connessione internet.")
             return None
         
-        # Funzione per ottenere la colonna di chiusura preferibile
-        def get_close_price(data):
-            if 'Adj Close' in data.columns:
-                return data['Adj Close']
-            elif 'Close' in data.columns:
-                return data['Close']
-            else:
-                # Se i dati sono multi-level (quando yfinance ritorna più ticker)
-                for col in data.columns:
-                    if 'Adj Close' in str(col) or 'Close' in str(col):
-                        return data[col]
-                return data.iloc[:, -1]  # Ultima colonna come fallback
-        
-        # Assicuriamoci che i dati siano allineati
-        combined_data = pd.DataFrame()
-        combined_data['VIX'] = get_close_price(vix_data)
-        combined_data['SP500'] = get_close_price(sp500_data)
+        # Assicuriamoci che i dati siano allineati, rimuovendo righe con valori NaN
+        closes = closes.rename(columns={'^VIX': 'VIX', '^GSPC': 'SP500'}).dropna()
         
-        # Rimuovi righe con valori NaN
-        combined_data = combined_data.dropna()
-        
-        if combined_data.empty:
+        if closes.empty:
             st.error("Nessun dato valido trovato per il periodo selezionato.")
             return None
         
+        vix = closes['VIX'].to_numpy(dtype=np.float64)
+        sp500 = closes['SP500'].to_numpy(dtype=np.float64)
+        
         # Calcola il rapporto VIX/S&P500 (moltiplicato per 1000 per maggiore leggibilità)
-        combined_data['Ratio'] = (combined_data['VIX'] / combined_data['SP500']) * 1000
+        ratio = vix / sp500 * 1000.0
         
-        # Aggiungi la media mobile a 20 giorni
+        # Media mobile a 20 giorni e Bande di Bollinger (stessa finestra):
+        # la banda centrale coincide con la media mobile
         ma_window = 20
-        combined_data[f'Ratio_MA_{ma_window}'] = combined_data['Ratio'].rolling(window=ma_window).mean()
-        
-        # Calcola le Bande di Bollinger
-        bb_period = 20
         bb_std = 2
-        combined_data['BB_Middle'] = combined_data['Ratio'].rolling(window=bb_period).mean()
-        bb_rolling_std = combined_data['Ratio'].rolling(window=bb_period).std()
-        combined_data['BB_Upper'] = combined_data['BB_Middle'] + (bb_rolling_std * bb_std)
-        combined_data['BB_Lower'] = combined_data['BB_Middle'] - (bb_rolling_std * bb_std)
+        ma, bb_upper, bb_lower = get_bollinger()(ratio, ma_window, float(bb_std))
         
-        return combined_data
+        return {
+            'index': closes.index,
+            'columns': {
+                'VIX': vix,
+                'SP500': sp500,
+                'Ratio': ratio,
+                f'Ratio_MA_{ma_window}': ma,
+                'BB_Upper': bb_upper,
+                'BB_Lower': bb_lower
+            }
+        }
     except Exception as e:
         st.error(f"Errore nel download dei dati: {e}")
         st.info("Suggerimento: Prova a modificare l'intervallo di date o riprova più tardi.")
         return None
 
+# Ricostruisce il DataFrame dagli array in cache
+def get_data(start_date, end_date):
+    series = load_series(start_date, end_date)
+    if series is None:
+        return None
+    # Array appena deserializzati dalla cache: nessuna copia
+    return pd.DataFrame(series['columns'], index=series['index'], copy=False)
+
+# Configurazione dell'asse X migliorata, comune a tutti i grafici
+SUB_XAXIS = dict(
+    tickformat='%Y-%m',  # Formato anno-mese
+    dtick='M6',  # Tick ogni 6 mesi
+    tickangle=45,  # Angolo dei tick per una migliore leggibilità
+    showgrid=True,
+    gridcolor='lightgray'
+)
+
+# Layout del grafico storico
+BASE_LAYOUT = dict(
+    height=800,
+    legend=dict(
+        orientation="h",
+        yanchor="bottom",
+        y=1.02,
+        xanchor="right",
+        x=1
+    ),
+    template="plotly_white",
+    xaxis=dict(SUB_XAXIS, title="Data")
+)
+
+# Costruisce il grafico storico; memorizzato per dati e opzioni di visualizzazione,
+# così i cambi di checkbox già visti non lo ricostruiscono
+@st.cache_resource(max_entries=32)
+def build_figure(_data, data_hash, show_ma, show_bb, show_vix, show_sp500):
+    # Import ritardati: plotly è pesante e serve solo per costruire il grafico
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    from plotly.subplots import make_subplots
+    
+    # Serializzazione JSON dei grafici con orjson (se installato), molto più rapida
+    # dell'encoder di default sugli array NumPy
+    try:
+        pio.json.config.default_engine = 'orjson'
+    except ValueError:
+        pass
+    
+    data = _data
+    
+    # Determina se mostrare uno o due grafici
+    show_secondary = show_vix or show_sp500
+    
+    if show_secondary:
+        # Crea sottografici
+        fig = make_subplots(rows=2, cols=1, 
+                           shared_xaxes=True, 
+                           vertical_spacing=0.1,
+                           row_heights=[0.7, 0.3],
+                           subplot_titles=("Rapporto VIX/S&P500", "Indici"))
+    else:
+        # Crea un singolo grafico
+        fig = go.Figure()
+    
+    # Grafico principale - Rapporto VIX/S&P500
+    # (le tracce usano float32, precisione più che sufficiente per la visualizzazione,
+    # dimezzando i dati inviati al browser; le statistiche restano in float64)
+    fig.add_trace(
+        go.Scattergl(
+            x=data.index,
+            y=data['Ratio'].to_numpy(dtype=np.float32),
+            name="Rapporto VIX/S&P500",
+            line=dict(color='blue', width=1)
+        ),
+        row=1 if show_secondary else None, 
+        col=1 if show_secondary else None
+    )
+    
+    # Aggiungi media mobile (20 giorni)
+    if show_ma:
+        fig.add_trace(
+            go.Scattergl(
+                x=data.index,
+                y=data['Ratio_MA_20'].to_numpy(dtype=np.float32),
+                name="Media Mobile (20 giorni)",
+                line=dict(color='red', width=2)
+            ),
+            row=1 if show_secondary else None, 
+            col=1 if show_secondary else None
+        )
+    
+    # Aggiungi Bande di Bollinger
+    if show_bb:
+        # Banda superiore
+        fig.add_trace(
+            go.Scattergl(
+                x=data.index,
+                y=data['BB_Upper'].to_numpy(dtype=np.float32),
+                name="Bollinger Superiore",
+                line=dict(color='gray', width=1, dash='dash'),
+                showlegend=True
+            ),
+            row=1 if show_secondary else None, 
+            col=1 if show_secondary else None
+        )
+        
+        # Banda inferiore
+        fig.add_trace(
+            go.Scattergl(
+                x=data.index,
+                y=data['BB_Lower'].to_numpy(dtype=np.float32),
+                name="Bollinger Inferiore",
+                line=dict(color='gray', width=1, dash='dash'),
+                fill='tonexty',
+                fillcolor='rgba(128,128,128,0.1)',
+                showlegend=True
+            ),
+            row=1 if show_secondary else None, 
+            col=1 if show_secondary else None
+        )
+        
+        # Banda centrale (media)
+        fig.add_trace(
+            go.Scattergl(
+                x=data.index,
+                y=data['Ratio_MA_20'].to_numpy(dtype=np.float32),
+                name="Bollinger Media",
+                line=dict(color='purple', width=1, dash='dot'),
+                showlegend=True
+            ),
+            row=1 if show_secondary else None, 
+            col=1 if show_secondary else None
+        )
+    
+    # Grafico secondario - VIX e S&P500 (normalizzati) - solo se necessario
+    if show_secondary:
+        if show_vix:
+            fig.add_trace(
+                go.Scattergl(
+                    x=data.index,
+                    y=data['VIX'].to_numpy(dtype=np.float32),
+                    name="VIX",
+                    line=dict(color='orange', width=1)
+                ),
+                row=2, col=1
+            )
+        
+        if show_sp500:
+            # Normalizza S&P500 per una migliore visualizzazione
+            norm_factor = data['VIX'].mean() / data['SP500'].mean()
+            fig.add_trace(
+                go.Scattergl(
+                    x=data.index,
+                    y=(data['SP500'] * norm_factor).to_numpy(dtype=np.float32),
+                    name="S&P500 (normalizzato)",
+                    line=dict(color='green', width=1)
+                ),
+                row=2, col=1
+            )
+    
+    # Layout migliorato per l'asse temporale
+    fig.update_layout(**BASE_LAYOUT)
+    
+    # Se abbiamo sottografici, configura anche l'asse X del secondo grafico
+    if show_secondary:
+        fig.update_xaxes(**SUB_XAXIS, title="Data", row=2, col=1)
+        # Configura anche il primo grafico se è un subplot
+        fig.update_xaxes(**SUB_XAXIS, row=1, col=1)
+    
+    # Titoli degli assi Y
+    if show_secondary:
+        fig.update_yaxes(title_text="Rapporto VIX/S&P500 (×1000)", row=1, col=1)
+        fig.update_yaxes(title_text="Valore Indice", row=2, col=1)
+    else:
+        fig.update_yaxes(title_text="Rapporto VIX/S&P500 (×1000)")
+    
+    return fig
+
+# Grafico storico con le relative checkbox; come fragment, un cambio di checkbox
+# riesegue solo questa funzione e non l'intero script
+@st.fragment
+def render_chart(data, data_hash):
+    # Checkbox per mostrare/nascondere componenti
+    # (nel corpo della pagina: i fragment non possono scrivere nella sidebar)
+    col1, col2, col3, col4 = st.columns(4)
+    show_ma = col1.checkbox("Mostra media mobile (20 giorni)", value=True)
+    show_bb = col2.checkbox("Mostra Bande di Bollinger", value=True)
+    show_vix = col3.checkbox("Mostra VIX", value=True)
+    show_sp500 = col4.checkbox("Mostra S&P500", value=True)
+    
+    fig = build_figure(data, data_hash, show_ma, show_bb, show_vix, show_sp500)
+    st.plotly_chart(fig, use_container_width=True)
+
+# Contenuto CSV per il download, memorizzato per non ricodificarlo a ogni rerun
+@st.cache_data(max_entries=32)
+def to_csv_bytes(df):
+    return df.to_csv().encode('utf-8')
+
 # Funzione principale
 def main():
     # Visualizza un messaggio di caricamento
@@ -107,13 +436,20 @@ def main():
         data = get_data(start_date, end_date)
     
     if data is not None and not data.empty:
+        # Ultimi due valori delle colonne usate per metriche e bande
+        last2 = data.iloc[-2:][['VIX', 'SP500', 'Ratio', 'BB_Upper', 'Ratio_MA_20', 'BB_Lower']].to_numpy()
+        vix_previous, vix_current = last2[:, 0]
+        sp500_previous, sp500_current = last2[:, 1]
+        ratio_previous, ratio_current = last2[:, 2]
+        current_bb_upper = last2[-1, 3]
+        current_bb_middle = last2[-1, 4]
+        current_bb_lower = last2[-1, 5]
+        
         # Informazioni sui dati
         st.subheader("Informazioni sugli Indici")
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            vix_current = data['VIX'].iloc[-1]
-            vix_previous = data['VIX'].iloc[-2]
             vix_change = vix_current - vix_previous
             vix_change_pct = (vix_change / vix_previous) * 100
             st.metric(
@@ -123,8 +459,6 @@ def main():
             )
         
         with col2:
-            sp500_current = data['SP500'].iloc[-1]
-            sp500_previous = data['SP500'].iloc[-2]
             sp500_change = sp500_current - sp500_previous
             sp500_change_pct = (sp500_change / sp500_previous) * 100
             st.metric(
@@ -134,8 +468,6 @@ def main():
             )
             
         with col3:
-            ratio_current = data['Ratio'].iloc[-1]
-            ratio_previous = data['Ratio'].iloc[-2]
             ratio_change = ratio_current - ratio_previous
             ratio_change_pct = (ratio_change / ratio_previous) * 100
             st.metric(
@@ -146,196 +478,38 @@ def main():
         
         # Crea grafico principale
         st.subheader("Grafico Storico")
-        
-        # Determina se mostrare uno o due grafici
-        show_secondary = show_vix or show_sp500
-        
-        if show_secondary:
-            # Crea sottografici
-            fig = make_subplots(rows=2, cols=1, 
-                               shared_xaxes=True, 
-                               vertical_spacing=0.1,
-                               row_heights=[0.7, 0.3],
-                               subplot_titles=("Rapporto VIX/S&P500", "Indici"))
-        else:
-            # Crea un singolo grafico
-            fig = go.Figure()
-        
-        # Grafico principale - Rapporto VIX/S&P500
-        fig.add_trace(
-            go.Scatter(
-                x=data.index, 
-                y=data['Ratio'],
-                name="Rapporto VIX/S&P500",
-                line=dict(color='blue', width=1)
-            ),
-            row=1 if show_secondary else None, 
-            col=1 if show_secondary else None
-        )
-        
-        # Aggiungi media mobile (20 giorni)
-        if show_ma:
-            fig.add_trace(
-                go.Scatter(
-                    x=data.index, 
-                    y=data['Ratio_MA_20'],
-                    name="Media Mobile (20 giorni)",
-                    line=dict(color='red', width=2)
-                ),
-                row=1 if show_secondary else None, 
-                col=1 if show_secondary else None
-            )
-        
-        # Aggiungi Bande di Bollinger
-        if show_bb:
-            # Banda superiore
-            fig.add_trace(
-                go.Scatter(
-                    x=data.index,
-                    y=data['BB_Upper'],
-                    name="Bollinger Superiore",
-                    line=dict(color='gray', width=1, dash='dash'),
-                    showlegend=True
-                ),
-                row=1 if show_secondary else None, 
-                col=1 if show_secondary else None
-            )
-            
-            # Banda inferiore
-            fig.add_trace(
-                go.Scatter(
-                    x=data.index,
-                    y=data['BB_Lower'],
-                    name="Bollinger Inferiore",
-                    line=dict(color='gray', width=1, dash='dash'),
-                    fill='tonexty',
-                    fillcolor='rgba(128,128,128,0.1)',
-                    showlegend=True
-                ),
-                row=1 if show_secondary else None, 
-                col=1 if show_secondary else None
-            )
-            
-            # Banda centrale (media)
-            fig.add_trace(
-                go.Scatter(
-                    x=data.index,
-                    y=data['BB_Middle'],
-                    name="Bollinger Media",
-                    line=dict(color='purple', width=1, dash='dot'),
-                    showlegend=True
-                ),
-                row=1 if show_secondary else None, 
-                col=1 if show_secondary else None
-            )
-        
-        # Grafico secondario - VIX e S&P500 (normalizzati) - solo se necessario
-        if show_secondary:
-            if show_vix:
-                fig.add_trace(
-                    go.Scatter(
-                        x=data.index, 
-                        y=data['VIX'],
-                        name="VIX",
-                        line=dict(color='orange', width=1)
-                    ),
-                    row=2, col=1
-                )
-            
-            if show_sp500:
-                # Normalizza S&P500 per una migliore visualizzazione
-                norm_factor = data['VIX'].mean() / data['SP500'].mean()
-                fig.add_trace(
-                    go.Scatter(
-                        x=data.index, 
-                        y=data['SP500'] * norm_factor,
-                        name="S&P500 (normalizzato)",
-                        line=dict(color='green', width=1)
-                    ),
-                    row=2, col=1
-                )
-        
-        # Layout migliorato per l'asse temporale
-        fig.update_layout(
-            height=800,
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            ),
-            template="plotly_white",
-            # Configurazione dell'asse X migliorata
-            xaxis=dict(
-                tickformat='%Y-%m',  # Formato anno-mese
-                dtick='M6',  # Tick ogni 6 mesi
-                tickangle=45,  # Angolo dei tick per una migliore leggibilità
-                showgrid=True,
-                gridcolor='lightgray',
-                title="Data"
-            )
-        )
-        
-        # Se abbiamo sottografici, configura anche l'asse X del secondo grafico
-        if show_secondary:
-            fig.update_xaxes(
-                tickformat='%Y-%m',
-                dtick='M6',
-                tickangle=45,
-                showgrid=True,
-                gridcolor='lightgray',
-                title="Data",
-                row=2, col=1
-            )
-            # Configura anche il primo grafico se è un subplot
-            fig.update_xaxes(
-                tickformat='%Y-%m',
-                dtick='M6',
-                tickangle=45,
-                showgrid=True,
-                gridcolor='lightgray',
-                row=1, col=1
-            )
-        
-        # Titoli degli assi Y
-        if show_secondary:
-            fig.update_yaxes(title_text="Rapporto VIX/S&P500 (×1000)", row=1, col=1)
-            fig.update_yaxes(title_text="Valore Indice", row=2, col=1)
-        else:
-            fig.update_yaxes(title_text="Rapporto VIX/S&P500 (×1000)")
-        
-        st.plotly_chart(fig, use_container_width=True)
+        render_chart(data, int(pd.util.hash_pandas_object(data).sum()))
         
         # Analisi statistica
         st.subheader("📊 Analisi Statistica")
+        
+        # Statistiche e percentili calcolati una sola volta sull'array ordinato
+        ratio_arr = data['Ratio'].to_numpy()
+        ratio_sorted = np.sort(ratio_arr)
+        percentiles = [10, 25, 50, 75, 90]
+        percentile_values = np.quantile(ratio_sorted, np.array(percentiles) / 100)
+        ratio_median = percentile_values[percentiles.index(50)]
+        ratio_mean = ratio_arr.mean()
+        ratio_std = ratio_arr.std(ddof=1)
+        ratio_min, ratio_max = ratio_sorted[0], ratio_sorted[-1]
+        
         col1, col2 = st.columns(2)
         
         with col1:
             st.write("Statistiche sul rapporto VIX/S&P500:")
             stats_df = pd.DataFrame({
                 'Statistiche': ["Media", "Mediana", "Minimo", "Massimo", "Deviazione Standard"],
-                'Valore': [
-                    f"{data['Ratio'].mean():.2f}",
-                    f"{data['Ratio'].median():.2f}",
-                    f"{data['Ratio'].min():.2f}",
-                    f"{data['Ratio'].max():.2f}",
-                    f"{data['Ratio'].std():.2f}"
-                ]
+                'Valore': [ratio_mean, ratio_median, ratio_min, ratio_max, ratio_std]
             })
-            st.dataframe(stats_df, hide_index=True)
+            st.dataframe(stats_df.style.format({'Valore': '{:.2f}'}), hide_index=True)
             
             # Aggiungi informazioni sulle Bande di Bollinger
             st.write("Posizione rispetto alle Bande di Bollinger:")
-            current_ratio = data['Ratio'].iloc[-1]
-            current_bb_upper = data['BB_Upper'].iloc[-1]
-            current_bb_lower = data['BB_Lower'].iloc[-1]
-            current_bb_middle = data['BB_Middle'].iloc[-1]
             
-            if current_ratio > current_bb_upper:
+            if ratio_current > current_bb_upper:
                 bb_position = "Sopra la banda superiore (ipercomprato)"
                 bb_color = "red"
-            elif current_ratio < current_bb_lower:
+            elif ratio_current < current_bb_lower:
                 bb_position = "Sotto la banda inferiore (ipervenduto)"
                 bb_color = "green"
             else:
@@ -348,31 +522,26 @@ def main():
             st.write(f"Banda inferiore: {current_bb_lower:.2f}")
             
         with col2:
-            # Calcola i percentili
-            percentiles = [10, 25, 50, 75, 90]
-            percentile_values = [data['Ratio'].quantile(p/100) for p in percentiles]
-            
             # Crea DataFrame per i percentili
             percentile_df = pd.DataFrame({
                 'Percentile': [f"{p}%" for p in percentiles],
-                'Valore': [f"{val:.2f}" for val in percentile_values]
+                'Valore': percentile_values
             })
             
             st.write("Percentili del rapporto:")
-            st.dataframe(percentile_df, hide_index=True)
+            st.dataframe(percentile_df.style.format({'Valore': '{:.2f}'}), hide_index=True)
             
             # Classifica il valore attuale
-            current_ratio = data['Ratio'].iloc[-1]
-            current_percentile = (data['Ratio'] <= current_ratio).mean() * 100
+            current_percentile = np.searchsorted(ratio_sorted, ratio_current, side='right') / ratio_sorted.size * 100
             
-            st.write(f"**Valore attuale: {current_ratio:.2f}** (percentile {current_percentile:.1f}%)")
+            st.write(f"**Valore attuale: {ratio_current:.2f}** (percentile {current_percentile:.1f}%)")
         
         # Tabella dati
         with st.expander("Mostra dati grezzi"):
             st.dataframe(data)
             
             # Pulsante per scaricare i dati
-            csv = data.to_csv().encode('utf-8')
+            csv = to_csv_bytes(data)
             st.download_button(
                 label="📥 Scarica dati CSV",
                 data=csv,